@@ -1,59 +1,375 @@
-import base64
+import hashlib
 import json
+import os
+import queue
+import re
 import subprocess
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, List, Optional
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    FrozenSet,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from app.http_client import shared_session
+
+try:
+    import pybase64 as base64
+except ModuleNotFoundError:  # optional SIMD encoder; same b64encode API as the stdlib module
+    import base64
+
+try:
+    import orjson
+except ModuleNotFoundError:  # optional accelerator; falls back to stdlib json
+    orjson = None
+
+try:
+    import ijson
+except ModuleNotFoundError:  # optional streaming parser for large batch responses
+    ijson = None
 
 try:
-    import requests
-except ModuleNotFoundError:  # optional in offline/test environments
-    requests = None
+    from blake3 import blake3
+except ModuleNotFoundError:  # optional SIMD hash; blake2b is plenty for dedupe keys
+    blake3 = None
+
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+META_FRAME_INDEX = "frame_index"
+META_TIMESTAMP_S = "timestamp_s"
+DEFAULT_MAX_SIDE = 768
+DEFAULT_JPEG_Q = 5
+DEDUPE_CACHE_SIZE = 1024
+STREAM_PARSE_MIN_FRAMES = 50
+_DEFAULT_PROMPT = (
+    "For each image, describe what the user is looking at, and extract any readable text "
+    "(prices, labels, signs). Return one JSON object per image."
+)
 
+# pybase64 drops the GIL while encoding, so a batch's frames can encode in parallel; the
+# stdlib encoder holds it, and on a single core the pool would only add handoff overhead.
+_B64_POOL: Optional[ThreadPoolExecutor] = (
+    ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="b64")
+    if base64.__name__ == "pybase64" and (os.cpu_count() or 1) > 1
+    else None
+)
+_SHOWINFO_PTS = re.compile(rb"\bn:\s*\d+\s+pts:\s*-?\d+\s+pts_time:\s*(-?[0-9.]+)")
 
-@dataclass
+
+# Slotted: no per-instance __dict__ for the one object every decoded frame allocates.
+@dataclass(slots=True)
 class FrameItem:
     frame_index: int
     timestamp_s: float
-    jpeg_path: Path
+    jpeg_bytes: bytes
+
+
+def run_command(cmd: List[str]) -> None:
+    # stderr stays raw bytes (quiet under -loglevel error) and is only decoded on failure.
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(
+            "Command failed:\n"
+            + " ".join(cmd)
+            + "\n\nSTDERR:\n"
+            + proc.stderr[-4000:].decode("utf-8", "replace")
+        )
 
 
-def _run(cmd: List[str]) -> None:
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if p.returncode != 0:
-        raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{p.stderr}")
+def split_jpeg_stream(stream: IO[bytes], read_size: int = 1 << 16) -> Iterator[bytes]:
+    # ffmpeg's image2pipe output is back-to-back JPEGs; cut on SOI..EOI markers.
+    # Consumed bytes are compacted once per read, and each frame is copied once.
+    read = getattr(stream, "read1", stream.read)
+    buf = bytearray()
+    pos = 0
+    scan = 2
+    while True:
+        data = read(read_size)
+        if not data:
+            return
+        if pos:
+            del buf[:pos]
+            scan -= pos
+            pos = 0
+        buf += data
+        while True:
+            end = buf.find(JPEG_EOI, scan)
+            if end < 0:
+                scan = max(len(buf) - 1, pos + 2)
+                break
+            start = buf.find(JPEG_SOI, pos, end)
+            if start >= 0:
+                with memoryview(buf) as view:
+                    frame = view[start : end + 2].tobytes()
+                yield frame
+            pos = end + 2
+            scan = pos + 2
+
+
+def _drain_stderr(
+    stream: IO[bytes],
+    tail: Deque[bytes],
+    pts_times: Optional["queue.Queue[Optional[float]]"],
+) -> None:
+    for line in stream:
+        match = _SHOWINFO_PTS.search(line) if pts_times is not None else None
+        if match:
+            pts_times.put(float(match.group(1)))
+        else:
+            tail.append(line)
+    if pts_times is not None:
+        pts_times.put(None)
+
+
+def iter_piped_frames(
+    cmd: List[str],
+    fps: float,
+    *,
+    showinfo_pts: bool = False,
+    stdin_data: Optional[bytes] = None,
+) -> Iterator[FrameItem]:
+    # stderr is drained on a thread so a chatty ffmpeg can never block on a full pipe;
+    # with showinfo_pts, each frame's real timestamp is taken from the showinfo filter log.
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin_data is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=1 << 20,
+    )
+    if stdin_data is not None:
+        # Only small inputs (a concat list) go this way; ffmpeg reads them fully before it
+        # writes any output, so this cannot deadlock against stdout.
+        proc.stdin.write(stdin_data)
+        proc.stdin.close()
+    tail: Deque[bytes] = deque(maxlen=50)
+    pts_times: Optional["queue.Queue[Optional[float]]"] = queue.Queue() if showinfo_pts else None
+    drain = threading.Thread(target=_drain_stderr, args=(proc.stderr, tail, pts_times), daemon=True)
+    drain.start()
+    try:
+        for i, jpeg in enumerate(split_jpeg_stream(proc.stdout)):
+            ts = pts_times.get() if pts_times is not None else None
+            if ts is None:
+                pts_times = None
+                ts = (i / fps) if fps > 0 else 0.0
+            yield FrameItem(frame_index=i, timestamp_s=round(ts, 3), jpeg_bytes=jpeg)
+    except GeneratorExit:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        drain.join()
+        proc.stderr.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{b''.join(tail).decode('utf-8', 'replace')}")
+
+
+@lru_cache(maxsize=1)
+def available_hwaccels() -> FrozenSet[str]:
+    try:
+        proc = subprocess.run(["ffmpeg", "-hide_banner", "-hwaccels"], capture_output=True, text=True)
+    except OSError:
+        return frozenset()
+    if proc.returncode != 0:
+        return frozenset()
+    _, _, methods = proc.stdout.partition("Hardware acceleration methods:")
+    return frozenset(line.strip() for line in methods.splitlines() if line.strip())
+
+
+def _hwaccel_args(hwaccel: Optional[str]) -> Tuple[List[str], str]:
+    # Returns (input options, filter prefix to bring frames back to system memory).
+    # None picks "auto" when this ffmpeg build lists any method; "none" forces CPU decode.
+    if hwaccel is None:
+        hwaccel = "auto" if available_hwaccels() else "none"
+    if hwaccel == "none":
+        return [], ""
+    if hwaccel == "cuda":
+        return (
+            ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"],
+            "scale_cuda=format=yuv420p,hwdownload,format=yuv420p,",
+        )
+    return ["-hwaccel", hwaccel], ""
+
+
+def _concat_input(chunk_paths: Sequence[str]) -> Tuple[List[str], bytes]:
+    # Entries resolve relative to the list's own URL, so they must carry an explicit file: prefix
+    # or ffmpeg would read them as pipe: paths.
+    listing = "".join(
+        "file 'file:{}'\n".format(os.path.abspath(p).replace("'", "'\\''")) for p in chunk_paths
+    )
+    args = ["-f", "concat", "-safe", "0", "-protocol_whitelist", "file,pipe", "-i", "pipe:0"]
+    return args, listing.encode("utf-8")
+
+
+def frame_output_args(
+    fps: float,
+    *,
+    keyframes_only: bool = False,
+    hw_download: str = "",
+    max_side: Optional[int] = DEFAULT_MAX_SIDE,
+    jpeg_q: int = DEFAULT_JPEG_Q,
+) -> List[str]:
+    # The one sampling/scaling/JPEG recipe for piped frames, shared by every ffmpeg run that feeds
+    # iter_piped_frames(showinfo_pts=True); it must follow the input args and any -map.
+    # Vision endpoints downsample to a few hundred px anyway; shrinking here (never upscaling)
+    # cuts JPEG size, base64 work and upload time roughly with pixel count.
+    scale = (
+        f"scale=w='min({max_side},iw)':h='min({max_side},ih)':force_original_aspect_ratio=decrease"
+        ":force_divisible_by=2:flags=area,"
+        if max_side
+        else ""
+    )
+    if keyframes_only:
+        # Decoding already skipped every delta frame (-skip_frame nokey on the input).
+        sample = ""
+    else:
+        # select keeps the first frame in each fixed 1/fps grid bucket with its original pts (the
+        # fps filter would retime onto a synthetic grid), and showinfo reports that pts for the
+        # timestamp. Buckets, unlike a "t - prev >= 1/fps" gap test, cannot drift when frame times
+        # land on the interval; the epsilon absorbs t*fps coming out as 0.999... on those boundaries.
+        # Sampling runs first so only the kept frames are downloaded from the GPU.
+        bucket = f"floor(t*{fps}+0.000001)"
+        sample = f"select='isnan(prev_selected_t)+gt({bucket},floor(prev_selected_t*{fps}+0.000001))',"
+    return [
+        "-fps_mode",
+        "passthrough",
+        "-vf",
+        f"{sample}{hw_download}{scale}showinfo",
+        "-f",
+        "image2pipe",
+        "-vcodec",
+        "mjpeg",
+        "-q:v",
+        str(jpeg_q),
+        "pipe:1",
+    ]
+
+
+def iter_frames_from_chunk(
+    chunk_path: Union[str, Sequence[str]],
+    fps: float = 0.5,
+    *,
+    keyframes_only: bool = False,
+    hwaccel: Optional[str] = None,
+    max_side: Optional[int] = DEFAULT_MAX_SIDE,
+    jpeg_q: int = DEFAULT_JPEG_Q,
+) -> Iterator[FrameItem]:
+    stdin_data: Optional[bytes] = None
+    if isinstance(chunk_path, (str, os.PathLike)):
+        input_args = ["-i", os.fspath(chunk_path)]
+    else:
+        # Several chunks decode in one ffmpeg run (a single startup and codec init) through a
+        # concat list on stdin; frame indices and timestamps then run across the joined timeline.
+        input_args, stdin_data = _concat_input(chunk_path)
+    hw_input, hw_download = _hwaccel_args(hwaccel)
+    # I-frames are self-contained, so the decoder can skip every delta frame outright.
+    skip = ["-skip_frame", "nokey"] if keyframes_only else []
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-nostats",
+        "-loglevel",
+        "info",
+        *hw_input,
+        *skip,
+        *input_args,
+        *frame_output_args(
+            fps,
+            keyframes_only=keyframes_only,
+            hw_download=hw_download,
+            max_side=max_side,
+            jpeg_q=jpeg_q,
+        ),
+    ]
+    return iter_piped_frames(cmd, fps, showinfo_pts=True, stdin_data=stdin_data)
 
 
 def extract_frames_from_chunk(
-    chunk_path: str,
-    out_dir: str,
+    chunk_path: Union[str, Sequence[str]],
     fps: float = 0.5,
+    *,
+    keyframes_only: bool = False,
+    hwaccel: Optional[str] = None,
+    max_side: Optional[int] = DEFAULT_MAX_SIDE,
+    jpeg_q: int = DEFAULT_JPEG_Q,
 ) -> List[FrameItem]:
-    chunk = Path(chunk_path).resolve()
-    out = Path(out_dir).resolve()
-    out.mkdir(parents=True, exist_ok=True)
+    return list(
+        iter_frames_from_chunk(
+            chunk_path,
+            fps=fps,
+            keyframes_only=keyframes_only,
+            hwaccel=hwaccel,
+            max_side=max_side,
+            jpeg_q=jpeg_q,
+        )
+    )
 
-    pattern = out / "frame_%05d.jpg"
-    _run([
-        "ffmpeg",
-        "-hide_banner",
-        "-y",
-        "-i",
-        str(chunk),
-        "-vf",
-        f"fps={fps}",
-        "-q:v",
-        "2",
-        str(pattern),
-    ])
 
-    frame_files = sorted(out.glob("frame_*.jpg"))
-    frames: List[FrameItem] = []
-    for i, f in enumerate(frame_files):
-        ts = (i / fps) if fps > 0 else 0.0
-        frames.append(FrameItem(frame_index=i, timestamp_s=round(ts, 3), jpeg_path=f))
-    return frames
+_PREFETCH_END = object()
+
+
+def _prefetch(source: Iterator[Any], maxsize: int) -> Generator[Any, None, None]:
+    # Pull `source` on its own thread into a bounded queue so ffmpeg keeps decoding while
+    # earlier batches are on the wire; closing this iterator stops the producer and closes source.
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def _offer(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        tail: Any = _PREFETCH_END
+        try:
+            for item in source:
+                if not _offer(item):
+                    return
+        except Exception as exc:
+            tail = exc
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+        _offer(tail)
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _PREFETCH_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
 
 
 def extract_audio_from_chunk(
@@ -63,14 +379,16 @@ def extract_audio_from_chunk(
     sample_rate: int = 16000,
     channels: int = 1,
 ) -> Path:
-    out_path = Path(out_audio_path).resolve()
+    out_path = Path(out_audio_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    _run([
+    run_command([
         "ffmpeg",
         "-hide_banner",
+        "-loglevel",
+        "error",
         "-y",
         "-i",
-        str(Path(chunk_path).resolve()),
+        os.fspath(chunk_path),
         "-vn",
         "-ac",
         str(channels),
@@ -81,21 +399,82 @@ def extract_audio_from_chunk(
     return out_path
 
 
-def batch_iter(items: List[Any], batch_size: int) -> Iterable[List[Any]]:
+def _frame_digest(data: bytes) -> bytes:
+    if blake3 is not None:
+        return blake3(data).digest()
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _dedupe_frames(
+    frames: Iterator[FrameItem],
+    aliases: List[Tuple[FrameItem, int]],
+    capacity: int = DEDUPE_CACHE_SIZE,
+) -> Iterator[FrameItem]:
+    # Byte-identical frames (static slides, paused screens) are only sent once; each repeat is
+    # recorded in `aliases` against the frame_index of the copy that was sent.
+    seen: "OrderedDict[bytes, int]" = OrderedDict()
+    for frame in frames:
+        digest = _frame_digest(frame.jpeg_bytes)
+        first = seen.get(digest)
+        if first is not None:
+            seen.move_to_end(digest)
+            aliases.append((frame, first))
+            continue
+        seen[digest] = frame.frame_index
+        if len(seen) > capacity:
+            seen.popitem(last=False)
+        yield frame
+
+
+def batch_iter(items: Iterable[Any], batch_size: int) -> Iterable[List[Any]]:
+    # Validated here rather than inside the generator, so a bad size fails at the call site.
     if batch_size <= 0:
         raise ValueError("batch_size must be > 0")
-    for i in range(0, len(items), batch_size):
-        yield items[i : i + batch_size]
+    return _iter_batches(iter(items), batch_size)
 
 
-def _jpeg_to_base64(jpeg_path: Path) -> str:
-    return base64.b64encode(jpeg_path.read_bytes()).decode("utf-8")
+def _iter_batches(it: Iterator[Any], batch_size: int) -> Iterator[List[Any]]:
+    while batch := list(islice(it, batch_size)):
+        yield batch
 
 
-def build_batch_payload(frames: List[FrameItem], prompt: str) -> Dict[str, Any]:
-    images_b64 = [_jpeg_to_base64(f.jpeg_path) for f in frames]
-    meta = [{"frame_index": f.frame_index, "timestamp_s": f.timestamp_s} for f in frames]
-    return {"prompt": prompt, "images_b64": images_b64, "meta": meta}
+def _jpeg_to_base64(frame: FrameItem) -> str:
+    # No mmap path: frames arrive over image2pipe and never touch disk, so the encoder already
+    # reads straight from the one in-memory copy split_jpeg_stream made.
+    return base64.b64encode(frame.jpeg_bytes).decode("ascii")
+
+
+def build_batch_payload(
+    frames: List[FrameItem],
+    prompt: str,
+    *,
+    skeleton: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    # A skeleton from an earlier call has its dict, lists and meta entries refilled in place, so
+    # it must stay on one thread and must not be retained by the sender past the call.
+    if skeleton is None:
+        skeleton = {"prompt": prompt, "images_b64": [], "meta": []}
+    else:
+        skeleton["prompt"] = prompt
+    n = len(frames)
+    images_b64: List[Optional[str]] = skeleton["images_b64"]
+    meta: List[Dict[str, Any]] = skeleton["meta"]
+    del meta[n:]
+    for i, f in enumerate(frames):
+        if i < len(meta):
+            entry = meta[i]
+            entry[META_FRAME_INDEX] = f.frame_index
+            entry[META_TIMESTAMP_S] = f.timestamp_s
+        else:
+            meta.append({META_FRAME_INDEX: f.frame_index, META_TIMESTAMP_S: f.timestamp_s})
+    if _B64_POOL is not None and n > 1:
+        images_b64[:] = _B64_POOL.map(_jpeg_to_base64, frames)
+    else:
+        del images_b64[n:]
+        images_b64.extend([None] * (n - len(images_b64)))
+        for i, f in enumerate(frames):
+            images_b64[i] = _jpeg_to_base64(f)
+    return skeleton
 
 
 def send_batch_to_ollama_vision(
@@ -105,48 +484,229 @@ def send_batch_to_ollama_vision(
     *,
     session: Optional[Any] = None,
 ) -> List[Dict[str, Any]]:
-    if session is None and requests is None:
+    client = session or shared_session()
+    if client is None:
+        raise RuntimeError("requests is required to send HTTP batches")
+    stream = _stream_results(len(payload["meta"]))
+    if orjson is not None:
+        # Batches carry megabytes of base64 text; orjson serializes straight to bytes.
+        r = client.post(
+            endpoint_url,
+            data=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"},
+            timeout=timeout_s,
+            stream=stream,
+        )
+    else:
+        r = client.post(endpoint_url, json=payload, timeout=timeout_s, stream=stream)
+    return _batch_results(r, stream)
+
+
+def build_multipart_payload(frames: List[FrameItem], prompt: str) -> Dict[str, Any]:
+    files = [
+        (
+            "images",
+            (
+                f"frame_{f.frame_index:06d}.jpg",
+                f.jpeg_bytes,
+                "image/jpeg",
+            ),
+        )
+        for f in frames
+    ]
+    meta = [{META_FRAME_INDEX: f.frame_index, META_TIMESTAMP_S: f.timestamp_s} for f in frames]
+    return {"data": {"prompt": prompt, "meta": json.dumps(meta)}, "files": files}
+
+
+def send_multipart_batch_to_ollama_vision(
+    payload: Dict[str, Any],
+    endpoint_url: str,
+    timeout_s: int = 120,
+    *,
+    session: Optional[Any] = None,
+) -> List[Dict[str, Any]]:
+    # Server contract: multipart/form-data with a "prompt" field, a "meta" field holding the
+    # JSON list of {frame_index, timestamp_s}, and one raw "images" JPEG part per meta entry
+    # in the same order. The response is the same {"results": [...]} as the JSON endpoint.
+    client = session or shared_session()
+    if client is None:
         raise RuntimeError("requests is required to send HTTP batches")
-    client = session or requests
-    r = client.post(endpoint_url, json=payload, timeout=timeout_s)
+    stream = _stream_results(len(payload["files"]))
+    r = client.post(
+        endpoint_url,
+        data=payload["data"],
+        files=payload["files"],
+        timeout=timeout_s,
+        stream=stream,
+    )
+    return _batch_results(r, stream)
+
+
+def _stream_results(frame_count: int) -> bool:
+    # Large batches return hundreds of KB of captions; parse those incrementally off the socket
+    # instead of buffering the whole body first. Small responses are faster through orjson.
+    return ijson is not None and frame_count > STREAM_PARSE_MIN_FRAMES
+
+
+class _ResultsCollector:
+    # ijson parse_coro target: builds each results[] element as soon as it closes, so at most one
+    # element is ever held half-built, and notes whether "results" was an array at all.
+    __slots__ = ("items", "is_list", "_builder", "_depth")
+
+    def __init__(self) -> None:
+        self.items: List[Any] = []
+        self.is_list = False
+        self._builder: Optional[Any] = None
+        self._depth = 0
+
+    def send(self, event: Tuple[str, str, Any]) -> None:
+        prefix, name, value = event
+        if self._builder is not None:
+            self._builder.event(name, value)
+            if name in ("start_map", "start_array"):
+                self._depth += 1
+            elif name in ("end_map", "end_array"):
+                self._depth -= 1
+                if self._depth == 0:
+                    self.items.append(self._builder.value)
+                    self._builder = None
+        elif prefix == "results.item":
+            if name in ("start_map", "start_array"):
+                self._builder = ijson.ObjectBuilder()
+                self._builder.event(name, value)
+                self._depth = 1
+            else:
+                self.items.append(value)
+        elif prefix == "results" and name == "start_array":
+            self.is_list = True
+
+
+def _batch_results(r: Any, streamed: bool = False) -> List[Dict[str, Any]]:
+    if streamed:
+        # Push-style parsing over iter_content consumes the body through requests, so the
+        # keep-alive connection goes back to the pool afterwards.
+        with r:
+            r.raise_for_status()
+            collector = _ResultsCollector()
+            parser = ijson.parse_coro(collector, use_float=True)
+            try:
+                for piece in r.iter_content(chunk_size=1 << 16):
+                    parser.send(piece)
+                parser.close()
+            except ijson.JSONError as exc:
+                # Same error type as the buffered path, whose JSON decoders raise ValueError.
+                raise ValueError(f"Unexpected response format: {exc}") from exc
+        if not collector.is_list:
+            raise ValueError("Unexpected response format: no results list")
+        return collector.items
     r.raise_for_status()
-    data = r.json()
+    data = orjson.loads(r.content) if orjson is not None else r.json()
     if "results" not in data or not isinstance(data["results"], list):
         raise ValueError(f"Unexpected response format: {data}")
     return data["results"]
 
 
 def process_chunk_with_batching(
-    chunk_path: str,
-    frames_dir: str,
+    chunk_path: Union[str, Sequence[str]],
     endpoint_url: str,
     *,
     fps: float = 0.5,
+    keyframes_only: bool = False,
     batch_size: int = 10,
-    max_workers: int = 1,
+    max_workers: int = 4,
     sender: Optional[Callable[[Dict[str, Any], str], List[Dict[str, Any]]]] = None,
+    session: Optional[Any] = None,
+    multipart: bool = False,
+    hwaccel: Optional[str] = None,
+    max_side: Optional[int] = DEFAULT_MAX_SIDE,
+    jpeg_q: int = DEFAULT_JPEG_Q,
+    dedupe: bool = True,
 ) -> List[Dict[str, Any]]:
-    frames = extract_frames_from_chunk(chunk_path, frames_dir, fps=fps)
-    prompt = (
-        "For each image, describe what the user is looking at, and extract any readable text "
-        "(prices, labels, signs). Return one JSON object per image."
+    source = iter_frames_from_chunk(
+        chunk_path,
+        fps=fps,
+        keyframes_only=keyframes_only,
+        hwaccel=hwaccel,
+        max_side=max_side,
+        jpeg_q=jpeg_q,
     )
-    send_fn = sender or send_batch_to_ollama_vision
+    # Filled on the prefetch thread; only read after `frames` is closed and that thread joined.
+    aliases: List[Tuple[FrameItem, int]] = []
+    if dedupe:
+        source = _dedupe_frames(source, aliases)
+    frames = _prefetch(source, maxsize=2 * batch_size)
+    # Multipart ships raw JPEG bytes and skips the base64 round trip (~33% smaller bodies),
+    # but needs a server that accepts it; JSON stays the default contract.
+    build_fn = build_multipart_payload if multipart else build_batch_payload
+    # Our own senders serialize the payload before returning, so each worker thread can refill
+    # one JSON payload skeleton; a custom sender might keep the payload and gets a fresh one.
+    skeletons = threading.local() if sender is None and not multipart else None
+    if sender is None:
+        # Resolve the pooled session once so every batch of this chunk rides the same keep-alive pool.
+        client = session or shared_session()
+        post_fn = send_multipart_batch_to_ollama_vision if multipart else send_batch_to_ollama_vision
+
+        def send_fn(payload: Dict[str, Any], url: str) -> List[Dict[str, Any]]:
+            return post_fn(payload, url, session=client)
 
-    batches = list(batch_iter(frames, batch_size=batch_size))
+    else:
+        send_fn = sender
+
+    batches = batch_iter(frames, batch_size=batch_size)
 
     def _send(batch: List[FrameItem]) -> List[Dict[str, Any]]:
-        payload = build_batch_payload(batch, prompt=prompt)
+        if skeletons is not None:
+            skeleton = getattr(skeletons, "payload", None)
+            payload = build_batch_payload(batch, _DEFAULT_PROMPT, skeleton=skeleton)
+            skeletons.payload = payload
+        else:
+            payload = build_fn(batch, prompt=_DEFAULT_PROMPT)
         return send_fn(payload, endpoint_url)
 
     all_results: List[Dict[str, Any]] = []
-    if max_workers <= 1:
-        for batch in batches:
-            all_results.extend(_send(batch))
-    else:
+
+    def _send_all(batch_source: Iterable[List[FrameItem]]) -> None:
+        if max_workers <= 1:
+            for batch in batch_source:
+                all_results.extend(_send(batch))
+            return
+        # Keep a bounded window in flight and drain whichever batch finishes first, so one
+        # slow response does not hold back the rest; results are re-sorted below anyway.
+        max_in_flight = 2 * max_workers
         with ThreadPoolExecutor(max_workers=max_workers) as pool:
-            for result in pool.map(_send, batches):
-                all_results.extend(result)
+            in_flight: Set["Future[List[Dict[str, Any]]]"] = set()
+            for batch in batch_source:
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        all_results.extend(future.result())
+                in_flight.add(pool.submit(_send, batch))
+            for future in as_completed(in_flight):
+                all_results.extend(future.result())
+
+    try:
+        _send_all(batches)
+    finally:
+        # Stops the extraction thread (and ffmpeg) if a send failed mid-chunk.
+        frames.close()
+
+    if aliases:
+        sent = {item.get(META_FRAME_INDEX): item for item in all_results}
+        unmatched: List[FrameItem] = []
+        for frame, first in aliases:
+            hit = sent.get(first)
+            if hit is None:
+                # The endpoint did not echo frame_index, so there is nothing to copy from;
+                # send the duplicate itself rather than dropping its result.
+                unmatched.append(frame)
+                continue
+            copy = dict(hit)
+            copy[META_FRAME_INDEX] = frame.frame_index
+            if META_TIMESTAMP_S in copy:
+                copy[META_TIMESTAMP_S] = frame.timestamp_s
+            all_results.append(copy)
+        if unmatched:
+            _send_all(batch_iter(unmatched, batch_size))
 
     return sorted(all_results, key=lambda item: item.get("frame_index", 0))
 
@@ -154,7 +714,6 @@ def process_chunk_with_batching(
 if __name__ == "__main__":
     results = process_chunk_with_batching(
         chunk_path=r"C:\Users\ahnaf\Desktop\entropy-hacked-2026\chunks\chunk_00000.mp4",
-        frames_dir=r"C:\Users\ahnaf\Desktop\entropy-hacked-2026\frames\chunk_00000",
         endpoint_url="https://YOUR_OLLAMA_SERVER/vision/batch",
         fps=0.5,
         batch_size=10,
@@ -1,53 +1,116 @@
+import bisect
 import csv
 import json
+import math
+import os
 import shutil
 import subprocess
+import tempfile
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from app.batching import FrameItem, frame_output_args, iter_piped_frames, run_command
 
-CHUNK_GLOB = "chunk_*.mp4"
+try:
+    import orjson
+except ModuleNotFoundError:  # optional accelerator; falls back to stdlib json
+    orjson = None
 
 
-def _run(cmd: List[str]) -> None:
-    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
-    if proc.returncode != 0:
-        raise RuntimeError(
-            "Command failed:\n"
-            + " ".join(cmd)
-            + "\n\nSTDERR:\n"
-            + (proc.stderr[-4000:] if proc.stderr else "")
-        )
+CHUNK_PREFIX = "chunk_"
+CHUNK_SUFFIX = ".mp4"
+SMART_CUT_CODECS = {"h264"}
+KEYFRAME_EPSILON_S = 1e-3
+_BARE = "default=noprint_wrappers=1:nokey=1"
 
 
-def _ffprobe_duration_seconds(video_path: Path) -> float:
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-show_entries",
-        "format=duration",
-        "-of",
-        "json",
-        str(video_path),
-    ]
+@dataclass
+class FragmentOutputs:
+    manifest: List[Dict[str, Any]]
+    frames: List[FrameItem] = field(default_factory=list)
+    audio_path: Optional[Path] = None
+    has_audio: bool = True
+
+
+def _ffprobe(video_path: Path, *args: str) -> str:
+    cmd = ["ffprobe", "-v", "error", *args, str(video_path)]
     p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     if p.returncode != 0:
         raise RuntimeError(f"ffprobe failed:\n{p.stderr}")
-    data = json.loads(p.stdout)
+    return p.stdout
+
+
+def _ffprobe_duration_seconds(video_path: Path) -> float:
+    data = json.loads(_ffprobe(video_path, "-show_entries", "format=duration", "-of", "json"))
     return float(data["format"]["duration"])
 
 
+def _ffprobe_has_audio(video_path: Path) -> bool:
+    out = _ffprobe(video_path, "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0")
+    return bool(out.strip())
+
+
+# The csv writer appends an empty side-data section ("h264,") to streams that carry side data such
+# as a display matrix, so single-value stream probes use the bare default writer instead.
+def _ffprobe_video_codec(video_path: Path) -> str:
+    out = _ffprobe(video_path, "-select_streams", "v:0", "-show_entries", "stream=codec_name", "-of", _BARE)
+    return out.strip()
+
+
+def _ffprobe_video_rotation(video_path: Path) -> float:
+    out = _ffprobe(
+        video_path, "-select_streams", "v:0", "-show_entries", "stream_side_data=rotation", "-of", _BARE
+    )
+    return next((float(value) for value in out.split()), 0.0)
+
+
+def _ffprobe_video_packets(video_path: Path) -> Tuple[List[float], List[float]]:
+    # Returns sorted (frame times, keyframe times). Packet timestamps and flags are read from
+    # the container, so no frame is decoded here.
+    out = _ffprobe(
+        video_path, "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0"
+    )
+    times: List[float] = []
+    keyframes: List[float] = []
+    for line in out.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if pts_time in ("", "N/A"):
+            continue
+        times.append(float(pts_time))
+        if "K" in flags:
+            keyframes.append(times[-1])
+    return sorted(times), sorted(keyframes)
+
+
+def _scan_chunk_files(out_path: Path) -> List[Path]:
+    # One readdir instead of glob + sort; ordered by the numeric segment index, which
+    # also stays correct if the zero-padded counter ever outgrows its width.
+    found: List[Tuple[int, Path]] = []
+    with os.scandir(out_path) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith(CHUNK_PREFIX) and name.endswith(CHUNK_SUFFIX):
+                index = name[len(CHUNK_PREFIX) : -len(CHUNK_SUFFIX)]
+                if index.isdigit():
+                    found.append((int(index), out_path / name))
+    found.sort()
+    return [path for _, path in found]
+
+
 def cleanup_chunk_files(out_dir: str, *, remove_manifest: bool = False) -> int:
     out_path = Path(out_dir).expanduser().resolve()
     if not out_path.exists():
         return 0
 
     deleted = 0
-    for pattern in (CHUNK_GLOB, "segments.csv"):
-        for file_path in out_path.glob(pattern):
-            file_path.unlink(missing_ok=True)
-            deleted += 1
+    for file_path in _scan_chunk_files(out_path):
+        file_path.unlink(missing_ok=True)
+        deleted += 1
+    segments = out_path / "segments.csv"
+    if segments.exists():
+        segments.unlink()
+        deleted += 1
 
     if remove_manifest:
         manifest = out_path / "manifest.json"
@@ -78,7 +141,8 @@ def _read_segment_timings(segment_list: Path) -> List[Dict[str, Any]]:
                     "index": index,
                     "start_s": round(start_s, 3),
                     "end_s": round(end_s, 3),
-                    "path": str((segment_list.parent / row[0]).resolve()),
+                    # Callers pass an already-resolved list path, so no per-row realpath.
+                    "path": str(segment_list.parent / row[0]),
                 }
             )
     return rows
@@ -90,13 +154,16 @@ def write_manifest(
     chunk_seconds: int,
     duration_s: Optional[float] = None,
     segment_list: Optional[str] = None,
+    timings: Optional[List[Dict[str, Any]]] = None,
 ) -> List[Dict[str, Any]]:
     out_path = Path(out_dir).expanduser().resolve()
-    source_segments = Path(segment_list).resolve() if segment_list else out_path / "segments.csv"
+    if timings is None:
+        source_segments = Path(segment_list).resolve() if segment_list else out_path / "segments.csv"
+        timings = _read_segment_timings(source_segments)
 
-    manifest = _read_segment_timings(source_segments)
+    manifest = timings
     if not manifest:
-        chunk_files = sorted(out_path.glob(CHUNK_GLOB))
+        chunk_files = _scan_chunk_files(out_path)
         if duration_s is None:
             raise ValueError("duration_s is required when no segment_list is available")
 
@@ -109,57 +176,29 @@ def write_manifest(
                     "index": i,
                     "start_s": round(start_s, 3),
                     "end_s": round(end_s, 3),
-                    "path": str(chunk_path.resolve()),
+                    "path": str(chunk_path),
                 }
             )
 
     manifest_path = out_path / "manifest.json"
-    manifest_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    if orjson is not None:
+        manifest_path.write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+    else:
+        manifest_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
     return manifest
 
 
-def chunk_video(
-    input_video: str,
-    out_dir: str,
-    chunk_seconds: int = 30,
-    *,
-    exact_boundaries: bool = False,
-    cleanup_existing: bool = False,
-    keep_segment_list: bool = False,
-) -> List[Dict[str, Any]]:
-    if not (10 <= chunk_seconds <= 60):
-        raise ValueError("chunk_seconds must be between 10 and 60")
-
-    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
-        raise EnvironmentError("ffmpeg/ffprobe not found on PATH. Install FFmpeg and try again.")
-
-    input_path = Path(input_video).expanduser().resolve()
-    if not input_path.exists():
-        raise FileNotFoundError(f"Input video not found: {input_path}")
-
-    out_path = Path(out_dir).expanduser().resolve()
-    out_path.mkdir(parents=True, exist_ok=True)
-
-    if cleanup_existing:
-        cleanup_chunk_files(str(out_path))
-
-    segment_list = out_path / "segments.csv"
-    output_pattern = out_path / "chunk_%05d.mp4"
-
-    cmd = [
-        "ffmpeg",
-        "-hide_banner",
-        "-y",
-        "-i",
-        str(input_path),
-        "-map",
-        "0",
-    ]
-
+def _segment_output_args(
+    output_pattern: Path,
+    segment_list: Path,
+    chunk_seconds: int,
+    exact_boundaries: bool,
+) -> List[str]:
+    args = ["-map", "0"]
     if not exact_boundaries:
-        cmd.extend(["-c", "copy"])
+        args.extend(["-c", "copy"])
     else:
-        cmd.extend(
+        args.extend(
             [
                 "-c:v",
                 "libx264",
@@ -176,7 +215,7 @@ def chunk_video(
             ]
         )
 
-    cmd.extend(
+    args.extend(
         [
             "-f",
             "segment",
@@ -191,16 +230,237 @@ def chunk_video(
             str(output_pattern),
         ]
     )
-    _run(cmd)
+    return args
+
+
+def _prepare_paths(
+    input_video: str,
+    out_dir: str,
+    chunk_seconds: int,
+    cleanup_existing: bool,
+) -> Tuple[Path, Path]:
+    if not (10 <= chunk_seconds <= 60):
+        raise ValueError("chunk_seconds must be between 10 and 60")
+
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        raise EnvironmentError("ffmpeg/ffprobe not found on PATH. Install FFmpeg and try again.")
+
+    input_path = Path(input_video).expanduser().resolve()
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input video not found: {input_path}")
+
+    out_path = Path(out_dir).expanduser().resolve()
+    out_path.mkdir(parents=True, exist_ok=True)
+
+    if cleanup_existing:
+        cleanup_chunk_files(str(out_path))
+
+    return input_path, out_path
+
+
+def _plan_smart_cut(keyframes: List[float], start_s: float, end_s: float) -> List[Tuple[float, float, bool]]:
+    # Returns (start, end, stream_copy) pieces: copy between the first and last keyframe
+    # inside the chunk, re-encode only the partial GOPs at either boundary.
+    first = bisect.bisect_left(keyframes, start_s - KEYFRAME_EPSILON_S)
+    last = bisect.bisect_right(keyframes, end_s + KEYFRAME_EPSILON_S) - 1
+    if first >= len(keyframes) or last < first or keyframes[first] >= end_s - KEYFRAME_EPSILON_S:
+        return [(start_s, end_s, False)]
+
+    k_in = max(keyframes[first], start_s)
+    k_out = min(keyframes[last], end_s)
+    parts: List[Tuple[float, float, bool]] = []
+    if k_in - start_s > KEYFRAME_EPSILON_S:
+        parts.append((start_s, k_in, False))
+    if k_out - k_in > KEYFRAME_EPSILON_S:
+        parts.append((k_in, k_out, True))
+    if end_s - k_out > KEYFRAME_EPSILON_S:
+        parts.append((k_out, end_s, False))
+    return parts
+
+
+def _cut_part_cmd(
+    input_path: Path,
+    part_path: Path,
+    start_s: float,
+    end_s: float,
+    copy_frames: Optional[int],
+) -> List[str]:
+    # Pieces are video only; each chunk's audio is encoded once, over the whole chunk, at the join.
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    if copy_frames is not None:
+        # Seek just past the keyframe so a rounded-down time cannot land on the GOP before it, and
+        # stop by frame count: -t cuts a copy by dts, which lets reordered B-frames run past the end.
+        cmd.extend(["-ss", f"{start_s + KEYFRAME_EPSILON_S:.6f}", "-i", str(input_path)])
+        cmd.extend(["-frames:v", str(copy_frames), "-c:v", "copy"])
+    else:
+        # Encoded in coded orientation like the copied pieces; the rotation is restored at the join.
+        cmd.extend(["-noautorotate", "-ss", f"{start_s:.6f}", "-i", str(input_path)])
+        cmd.extend(["-t", f"{end_s - start_s:.6f}", "-c:v", "libx264", "-preset", "veryfast", "-crf", "23"])
+    # Annex B keeps every piece's SPS/PPS in band, so copied and re-encoded pieces can be joined
+    # by the concat demuxer without touching the bitstream.
+    cmd.extend(["-map", "0:v:0", "-bsf:v", "h264_mp4toannexb", "-f", "matroska", str(part_path)])
+    return cmd
+
+
+def _join_parts_cmd(
+    input_path: Path,
+    concat_list: Path,
+    chunk_path: Path,
+    start_s: float,
+    end_s: float,
+    rotation: float,
+    with_audio: bool,
+) -> List[str]:
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    if rotation:
+        cmd.extend(["-display_rotation:v:0", f"{rotation:g}"])
+    cmd.extend(["-f", "concat", "-safe", "0", "-i", str(concat_list)])
+    if with_audio:
+        cmd.extend(["-ss", f"{start_s:.6f}", "-t", f"{end_s - start_s:.6f}", "-i", str(input_path)])
+    cmd.extend(["-map", "0:v:0", "-c:v", "copy"])
+    if with_audio:
+        cmd.extend(["-map", "1:a:0", "-c:a", "aac", "-b:a", "128k"])
+    cmd.append(str(chunk_path))
+    return cmd
+
+
+def _smart_cut_video(
+    input_path: Path,
+    out_path: Path,
+    chunk_seconds: int,
+    *,
+    with_audio: bool,
+) -> List[Dict[str, Any]]:
+    duration_s = _ffprobe_duration_seconds(input_path)
+    frame_times, keyframes = _ffprobe_video_packets(input_path)
+    rotation = _ffprobe_video_rotation(input_path)
+    count = max(1, math.ceil(duration_s / chunk_seconds))
+    bounds = [min(i * chunk_seconds, duration_s) for i in range(count + 1)]
+
+    (out_path / "segments.csv").unlink(missing_ok=True)
+    with tempfile.TemporaryDirectory(dir=out_path) as tmp:
+        tmp_path = Path(tmp)
+        for index, (start_s, end_s) in enumerate(zip(bounds, bounds[1:])):
+            part_paths: List[Path] = []
+            for n, (part_start, part_end, stream_copy) in enumerate(_plan_smart_cut(keyframes, start_s, end_s)):
+                copy_frames: Optional[int] = None
+                if stream_copy:
+                    first = bisect.bisect_left(frame_times, part_start - KEYFRAME_EPSILON_S)
+                    copy_frames = bisect.bisect_left(frame_times, part_end - KEYFRAME_EPSILON_S) - first
+                part_path = tmp_path / f"part_{index:05d}_{n}.mkv"
+                run_command(_cut_part_cmd(input_path, part_path, part_start, part_end, copy_frames))
+                part_paths.append(part_path)
+
+            concat_list = tmp_path / f"concat_{index:05d}.txt"
+            concat_list.write_text(
+                "".join("file '{}'\n".format(str(p).replace("'", "'\\''")) for p in part_paths),
+                encoding="utf-8",
+            )
+            chunk_path = out_path / f"chunk_{index:05d}.mp4"
+            run_command(
+                _join_parts_cmd(input_path, concat_list, chunk_path, start_s, end_s, rotation, with_audio)
+            )
+
+    return write_manifest(str(out_path), chunk_seconds=chunk_seconds, duration_s=duration_s)
+
+
+def _audio_output_args(audio_out: Path) -> List[str]:
+    return ["-map", "0:a:0", "-ac", "1", "-ar", "16000", "-f", "wav", str(audio_out)]
+
 
+def _frames_output_args(fps: float) -> List[str]:
+    # app.batching's recipe, so sampled frames, sizes and timestamps match whichever path extracts them.
+    return ["-map", "0:v:0", *frame_output_args(fps)]
+
+
+def fragment_and_extract(
+    input_video: str,
+    out_dir: str,
+    chunk_seconds: int = 30,
+    *,
+    fps: Optional[float] = None,
+    audio_path: Optional[str] = None,
+    exact_boundaries: bool = False,
+    smart_cut: bool = False,
+    cleanup_existing: bool = False,
+    keep_segment_list: bool = False,
+) -> FragmentOutputs:
+    input_path, out_path = _prepare_paths(input_video, out_dir, chunk_seconds, cleanup_existing)
+
+    has_audio = _ffprobe_has_audio(input_path)
+    audio_out: Optional[Path] = None
+    if audio_path is not None and has_audio:
+        audio_out = Path(audio_path).expanduser().resolve()
+        audio_out.parent.mkdir(parents=True, exist_ok=True)
+
+    manifest: Optional[List[Dict[str, Any]]] = None
+    frames: List[FrameItem] = []
+    if exact_boundaries and smart_cut and _ffprobe_video_codec(input_path) in SMART_CUT_CODECS:
+        try:
+            manifest = _smart_cut_video(input_path, out_path, chunk_seconds, with_audio=has_audio)
+        except RuntimeError:
+            # Any piece ffmpeg rejects sends the whole upload through the full re-encode below.
+            cleanup_chunk_files(str(out_path))
+    if manifest is not None:
+        # Exact chunks without re-encoding whole GOPs; audio and frames are then cheap separate
+        # passes (demux + audio decode, and a sampled video decode only when frames are wanted).
+        source = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", str(input_path)]
+        if audio_out is not None:
+            run_command(source + _audio_output_args(audio_out))
+        if fps is not None:
+            cmd = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "info", "-i", str(input_path)]
+            frames = list(iter_piped_frames(cmd + _frames_output_args(fps), fps, showinfo_pts=True))
+        return FragmentOutputs(manifest=manifest, frames=frames, audio_path=audio_out, has_audio=has_audio)
+
+    segment_list = out_path / "segments.csv"
+    output_pattern = out_path / "chunk_%05d.mp4"
+
+    # One decode feeds every output: segmented chunks, sampled frames, mono audio. Frame
+    # timestamps come from showinfo, which only logs at info level.
+    loglevel = "info" if fps is not None else "error"
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", loglevel, "-y", "-i", str(input_path)]
+    cmd.extend(_segment_output_args(output_pattern, segment_list, chunk_seconds, exact_boundaries))
+    if audio_out is not None:
+        cmd.extend(_audio_output_args(audio_out))
+
+    if fps is not None:
+        cmd.extend(_frames_output_args(fps))
+        frames = list(iter_piped_frames(cmd, fps, showinfo_pts=True))
+    else:
+        run_command(cmd)
+
+    # The segment muxer already recorded exact start/end times; probe only without them.
+    timings = _read_segment_timings(segment_list)
+    duration_s = None if timings else _ffprobe_duration_seconds(input_path)
     manifest = write_manifest(
         str(out_path),
         chunk_seconds=chunk_seconds,
-        duration_s=_ffprobe_duration_seconds(input_path),
-        segment_list=str(segment_list),
+        duration_s=duration_s,
+        timings=timings,
     )
 
     if not keep_segment_list and segment_list.exists():
         segment_list.unlink()
 
-    return manifest
\ No newline at end of file
+    return FragmentOutputs(manifest=manifest, frames=frames, audio_path=audio_out, has_audio=has_audio)
+
+
+def chunk_video(
+    input_video: str,
+    out_dir: str,
+    chunk_seconds: int = 30,
+    *,
+    exact_boundaries: bool = False,
+    smart_cut: bool = False,
+    cleanup_existing: bool = False,
+    keep_segment_list: bool = False,
+) -> List[Dict[str, Any]]:
+    return fragment_and_extract(
+        input_video,
+        out_dir,
+        chunk_seconds,
+        exact_boundaries=exact_boundaries,
+        smart_cut=smart_cut,
+        cleanup_existing=cleanup_existing,
+        keep_segment_list=keep_segment_list,
+    ).manifest
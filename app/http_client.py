@@ -0,0 +1,46 @@
+import threading
+from typing import Any, Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ModuleNotFoundError:  # optional in offline/test environments
+    requests = None
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+_session: Optional[Any] = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> Any:
+    # An unreachable or hung Ollama is the normal trigger for the hash fallback, and a POST
+    # that reached the server may already have run inference, so connect/read/other failures
+    # are never retried; only gateway-style status responses are.
+    retry = Retry(
+        total=2,
+        connect=0,
+        read=False,
+        other=0,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def shared_session() -> Optional[Any]:
+    global _session
+    if requests is None:
+        return None
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+    return _session
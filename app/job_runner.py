@@ -52,13 +52,9 @@ class BackgroundJobRunner:
         self._job_queue.put(job)
 
     def join(self, timeout: Optional[float] = None) -> bool:
-        start = time.time()
-        while True:
-            if self._job_queue.unfinished_tasks == 0:
-                return True
-            if timeout is not None and (time.time() - start) > timeout:
-                return False
-            time.sleep(0.01)
+        job_queue = self._job_queue
+        with job_queue.all_tasks_done:
+            return job_queue.all_tasks_done.wait_for(lambda: job_queue.unfinished_tasks == 0, timeout)
 
     def shutdown(self) -> None:
         self._stop_event.set()
@@ -92,11 +88,7 @@ class BackgroundJobRunner:
 
     def _worker_loop(self) -> None:
         while not self._stop_event.is_set():
-            try:
-                job = self._job_queue.get(timeout=0.05)
-            except queue.Empty:
-                continue
-
+            job = self._job_queue.get()
             try:
                 if job.job_id == "__shutdown__":
                     return
@@ -1,24 +1,33 @@
 from __future__ import annotations
 
+import bisect
 import hashlib
+import itertools
 import json
 import os
 import sqlite3
+import threading
 import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+from numpy.typing import ArrayLike
 from fastapi import FastAPI, File, HTTPException, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
-from app.fragmentation import chunk_video
+from app.fragmentation import fragment_and_extract
+from app.http_client import shared_session
+from app.job_runner import BackgroundJobRunner, Job
 
 try:
-    import requests
+    import orjson
 except ModuleNotFoundError:  # pragma: no cover
-    requests = None
+    orjson = None
 
 try:
     from faster_whisper import WhisperModel
@@ -35,16 +44,50 @@ STATIC_DIR = BASE_DIR / "app" / "static"
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/embeddings")
 OLLAMA_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
 EMBED_DIM = 64
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "4"))
+UPLOAD_READ_SIZE = 1 << 20
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "1"))
+EMBED_DTYPE = np.dtype("<f4")
+
+_OLLAMA_SESSION = shared_session()
+
+_whisper_model: Optional[Any] = None
+_whisper_lock = threading.Lock()
+
+
+def _get_whisper_model() -> Any:
+    global _whisper_model
+    with _whisper_lock:
+        if _whisper_model is None:
+            _whisper_model = WhisperModel("tiny", device="cpu", compute_type="int8")
+    return _whisper_model
+
+
+def transcribe_full(audio_path: Path) -> List[Tuple[float, float, str]]:
+    if WhisperModel is None:
+        return []
+    segments, _ = _get_whisper_model().transcribe(
+        str(audio_path),
+        beam_size=1,
+        vad_filter=True,
+        condition_on_previous_text=False,
+    )
+    return [(seg.start, seg.end, seg.text.strip()) for seg in segments]
 
 
 class SearchService:
     def __init__(self, db_path: Path):
         self.db_path = db_path
-        self._whisper_model: Optional[Any] = None
+        self._embed_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._embed_cache_loaded = False
+        self._embed_cache_lock = threading.Lock()
 
     def _conn(self) -> sqlite3.Connection:
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
         return conn
 
     def setup(self) -> None:
@@ -52,6 +95,7 @@ class SearchService:
         UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
         CHUNKS_DIR.mkdir(parents=True, exist_ok=True)
         with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS videos (
@@ -73,11 +117,22 @@ class SearchService:
                     end_s REAL NOT NULL,
                     chunk_path TEXT NOT NULL,
                     transcript TEXT NOT NULL,
-                    embedding TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
                     FOREIGN KEY(video_id) REFERENCES videos(id)
                 )
                 """
             )
+            conn.execute("CREATE TABLE IF NOT EXISTS embed_cache (hash TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_video_chunk ON chunks(video_id, chunk_idx)")
+            conn.execute("CREATE INDEX IF NOT EXISTS videos_status ON videos(status)")
+            # Upload jobs only live in memory, so anything still processing was cut off by a restart.
+            conn.execute("UPDATE videos SET status = 'failed' WHERE status = 'processing'")
+            legacy = conn.execute("SELECT id, embedding FROM chunks WHERE typeof(embedding) = 'text'").fetchall()
+            loads = orjson.loads if orjson is not None else json.loads
+            conn.executemany(
+                "UPDATE chunks SET embedding = ? WHERE id = ?",
+                [(self._pack_embedding(loads(row["embedding"])), row["id"]) for row in legacy],
+            )
 
     def create_video(self, filename: str, upload_path: Path) -> str:
         video_id = str(uuid.uuid4())
@@ -94,45 +149,107 @@ class SearchService:
                 "UPDATE videos SET status = ?, manifest_path = COALESCE(?, manifest_path) WHERE id = ?",
                 (status, str(manifest_path) if manifest_path else None, video_id),
             )
+            rows = (
+                conn.execute(
+                    "SELECT chunk_idx, embedding FROM chunks WHERE video_id = ? ORDER BY chunk_idx",
+                    (video_id,),
+                ).fetchall()
+                if status == "ready"
+                else []
+            )
+        # Search only sees a video once it is ready, never while it is still indexing or failing.
+        entry = self._cache_entry([row["chunk_idx"] for row in rows], [row["embedding"] for row in rows])
+        with self._embed_cache_lock:
+            if entry is None:
+                self._embed_cache.pop(video_id, None)
+            else:
+                self._embed_cache[video_id] = entry
+
+    def index_chunks(
+        self,
+        video_id: str,
+        manifest: List[Dict[str, Any]],
+        audio_path: Optional[Path] = None,
+        has_audio: bool = True,
+    ) -> None:
+        transcripts: List[Optional[str]] = [None] * len(manifest)
+        if not has_audio:
+            # Nothing to transcribe; Whisper would only decode each silent chunk to get nothing back.
+            transcripts = [self._placeholder_transcript(Path(item["path"])) for item in manifest]
+        elif audio_path is not None and WhisperModel is not None:
+            transcripts = self._split_transcript(manifest, transcribe_full(audio_path))
+
+        def _prepare(item: Dict[str, Any], transcript: Optional[str]) -> Tuple[Any, ...]:
+            if transcript is None:
+                transcript = self._chunk_transcript(Path(item["path"]))
+            return (
+                video_id,
+                int(item["index"]),
+                float(item["start_s"]),
+                float(item["end_s"]),
+                str(item["path"]),
+                transcript,
+                self._pack_embedding(self._embed_text(transcript)),
+            )
+
+        # Whisper runs in native code and embedding calls are network-bound, so threads overlap.
+        with ThreadPoolExecutor(max_workers=INDEX_WORKERS) as pool:
+            rows = list(pool.map(_prepare, manifest, transcripts))
 
-    def index_chunks(self, video_id: str, manifest: List[Dict[str, Any]]) -> None:
         with self._conn() as conn:
             conn.execute("DELETE FROM chunks WHERE video_id = ?", (video_id,))
+            conn.executemany(
+                """
+                INSERT INTO chunks(video_id, chunk_idx, start_s, end_s, chunk_path, transcript, embedding)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
 
-            for item in manifest:
-                transcript = self._chunk_transcript(Path(item["path"]))
-                embedding = self._embed_text(transcript)
-                conn.execute(
-                    """
-                    INSERT INTO chunks(video_id, chunk_idx, start_s, end_s, chunk_path, transcript, embedding)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        video_id,
-                        int(item["index"]),
-                        float(item["start_s"]),
-                        float(item["end_s"]),
-                        str(item["path"]),
-                        transcript,
-                        json.dumps(embedding),
-                    ),
-                )
+    def _split_transcript(
+        self,
+        manifest: List[Dict[str, Any]],
+        segments: List[Tuple[float, float, str]],
+    ) -> List[str]:
+        starts = [float(item["start_s"]) for item in manifest]
+        buckets: List[List[str]] = [[] for _ in manifest]
+        for start_s, _end_s, text in segments:
+            if text and buckets:
+                buckets[max(bisect.bisect_right(starts, start_s) - 1, 0)].append(text)
+        return [
+            " ".join(texts) or self._placeholder_transcript(Path(item["path"]))
+            for item, texts in zip(manifest, buckets)
+        ]
 
     def _chunk_transcript(self, chunk_path: Path) -> str:
         if WhisperModel is None:
-            return f"Video chunk {chunk_path.stem.replace('_', ' ')}"
+            return self._placeholder_transcript(chunk_path)
+
+        segments, _ = _get_whisper_model().transcribe(
+            str(chunk_path),
+            beam_size=1,
+            vad_filter=True,
+            condition_on_previous_text=False,
+        )
+        transcript = " ".join(seg.text.strip() for seg in segments).strip()
+        return transcript or self._placeholder_transcript(chunk_path)
 
-        if self._whisper_model is None:
-            self._whisper_model = WhisperModel("tiny", device="cpu", compute_type="int8")
+    @staticmethod
+    def _placeholder_transcript(chunk_path: Path) -> str:
+        return f"Video chunk {chunk_path.stem.replace('_', ' ')}"
 
-        segments, _ = self._whisper_model.transcribe(str(chunk_path), beam_size=1)
-        transcript = " ".join(seg.text.strip() for seg in segments).strip()
-        return transcript or f"Video chunk {chunk_path.stem.replace('_', ' ')}"
+    def _embed_text(self, text: str) -> np.ndarray:
+        # Only real Ollama vectors are cached; the hash fallback is cheaper than a lookup.
+        cache_key = hashlib.blake2b(f"{OLLAMA_MODEL}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+        with self._conn() as conn:
+            cached = conn.execute("SELECT vec FROM embed_cache WHERE hash = ?", (cache_key,)).fetchone()
+        if cached is not None:
+            return self._normalize(np.frombuffer(cached["vec"], dtype=EMBED_DTYPE))
 
-    def _embed_text(self, text: str) -> List[float]:
-        if requests is not None:
+        vec: Optional[np.ndarray] = None
+        if _OLLAMA_SESSION is not None:
             try:
-                response = requests.post(
+                response = _OLLAMA_SESSION.post(
                     OLLAMA_URL,
                     json={"model": OLLAMA_MODEL, "prompt": text},
                     timeout=10,
@@ -140,58 +257,128 @@ class SearchService:
                 response.raise_for_status()
                 data = response.json()
                 if isinstance(data.get("embedding"), list):
-                    return [float(v) for v in data["embedding"]]
+                    vec = np.asarray(data["embedding"], dtype=EMBED_DTYPE)
             except Exception:
                 pass
 
+        if vec is not None:
+            # Best effort: a locked or failing cache must not cost us a valid Ollama vector.
+            try:
+                with self._conn() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO embed_cache(hash, vec) VALUES (?, ?)",
+                        (cache_key, self._pack_embedding(vec)),
+                    )
+            except sqlite3.Error:
+                pass
+            return self._normalize(vec)
+
         digest = hashlib.sha256(text.encode("utf-8")).digest()
-        vals = []
-        for i in range(EMBED_DIM):
-            vals.append(((digest[i % len(digest)] / 255.0) * 2) - 1)
-        return vals
+        raw = np.frombuffer(digest * -(-EMBED_DIM // len(digest)), dtype=np.uint8)[:EMBED_DIM]
+        return self._normalize(raw.astype(EMBED_DTYPE) / 127.5 - 1.0)
 
-    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        query_vec = self._embed_text(query)
+    @staticmethod
+    def _normalize(vecs: np.ndarray) -> np.ndarray:
+        # Unit vectors turn cosine similarity into a plain dot product at query time.
+        norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+        return np.divide(vecs, norms, out=np.zeros_like(vecs), where=norms > 0)
+
+    @staticmethod
+    def _cache_entry(chunk_idxs: List[int], blobs: List[bytes]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if not blobs:
+            return None
+        # A video is scored in one embedding space; stray rows from another embedder are left out.
+        width = Counter(len(blob) for blob in blobs).most_common(1)[0][0]
+        keep = [i for i, blob in enumerate(blobs) if len(blob) == width]
+        matrix = np.frombuffer(b"".join(blobs[i] for i in keep), dtype=EMBED_DTYPE).reshape(len(keep), -1)
+        return np.asarray([chunk_idxs[i] for i in keep], dtype=np.int64), SearchService._normalize(matrix)
+
+    def _load_embed_cache(self) -> None:
         with self._conn() as conn:
             rows = conn.execute(
                 """
-                SELECT c.video_id, c.chunk_idx, c.start_s, c.end_s, c.chunk_path, c.transcript, c.embedding, v.filename
+                SELECT c.video_id, c.chunk_idx, c.embedding
                 FROM chunks c JOIN videos v ON v.id = c.video_id
                 WHERE v.status = 'ready'
+                ORDER BY c.video_id, c.chunk_idx
                 """
             ).fetchall()
 
-        scored: List[Dict[str, Any]] = []
-        for row in rows:
-            chunk_vec = json.loads(row["embedding"])
-            score = self._cosine_similarity(query_vec, chunk_vec)
-            snippet = row["transcript"][:180]
-            scored.append(
+        cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for video_id, group in itertools.groupby(rows, key=lambda row: row["video_id"]):
+            items = list(group)
+            entry = self._cache_entry([row["chunk_idx"] for row in items], [row["embedding"] for row in items])
+            if entry is not None:
+                cache[video_id] = entry
+        self._embed_cache = cache
+        self._embed_cache_loaded = True
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        query_vec = self._embed_text(query)
+        if limit <= 0 or query_vec.size == 0:
+            return []
+
+        with self._embed_cache_lock:
+            if not self._embed_cache_loaded:
+                self._load_embed_cache()
+            # Vectors of another width come from a different embedder and are not comparable.
+            entries = [
+                (video_id, chunk_idxs, matrix)
+                for video_id, (chunk_idxs, matrix) in self._embed_cache.items()
+                if matrix.shape[1] == query_vec.size
+            ]
+        if not entries:
+            return []
+
+        matrix = np.concatenate([entry[2] for entry in entries])
+        chunk_idxs = np.concatenate([entry[1] for entry in entries])
+        owners = np.repeat(np.arange(len(entries)), [len(entry[1]) for entry in entries])
+        scores = matrix @ query_vec
+
+        if limit < len(scores):
+            top = np.argpartition(scores, -limit)[-limit:]
+            top = top[np.argsort(-scores[top], kind="stable")]
+        else:
+            top = np.argsort(-scores, kind="stable")
+        hits = [(entries[owners[i]][0], int(chunk_idxs[i]), float(scores[i])) for i in top]
+        return self._materialize_hits(hits)
+
+    def _materialize_hits(self, hits: List[Tuple[str, int, float]]) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("(?, ?)" for _ in hits)
+        params = [value for video_id, chunk_idx, _ in hits for value in (video_id, chunk_idx)]
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT c.video_id, c.chunk_idx, c.start_s, c.end_s, c.transcript, v.filename
+                FROM chunks c JOIN videos v ON v.id = c.video_id
+                WHERE (c.video_id, c.chunk_idx) IN (VALUES {placeholders})
+                """,
+                params,
+            ).fetchall()
+        by_key = {(row["video_id"], row["chunk_idx"]): row for row in rows}
+
+        results: List[Dict[str, Any]] = []
+        for video_id, chunk_idx, score in hits:
+            row = by_key.get((video_id, chunk_idx))
+            if row is None:
+                continue
+            results.append(
                 {
-                    "video_id": row["video_id"],
+                    "video_id": video_id,
                     "filename": row["filename"],
-                    "chunk_idx": row["chunk_idx"],
+                    "chunk_idx": chunk_idx,
                     "start_s": row["start_s"],
                     "end_s": row["end_s"],
                     "score": round(score, 4),
-                    "snippet": snippet,
-                    "clip_url": f"/clips/{row['video_id']}/{row['chunk_idx']}",
+                    "snippet": row["transcript"][:180],
+                    "clip_url": f"/clips/{video_id}/{chunk_idx}",
                 }
             )
-
-        return sorted(scored, key=lambda x: x["score"], reverse=True)[:limit]
+        return results
 
     @staticmethod
-    def _cosine_similarity(a: List[float], b: List[float]) -> float:
-        n = min(len(a), len(b))
-        if n == 0:
-            return 0.0
-        dot = sum(a[i] * b[i] for i in range(n))
-        an = sum(a[i] * a[i] for i in range(n)) ** 0.5
-        bn = sum(b[i] * b[i] for i in range(n)) ** 0.5
-        if an == 0 or bn == 0:
-            return 0.0
-        return dot / (an * bn)
+    def _pack_embedding(vec: ArrayLike) -> bytes:
+        return np.asarray(vec, dtype=EMBED_DTYPE).tobytes()
 
     def list_videos(self) -> List[Dict[str, Any]]:
         with self._conn() as conn:
@@ -220,9 +407,41 @@ class SearchService:
         return Path(row["chunk_path"])
 
 
+def process_upload(payload: Dict[str, Any]) -> int:
+    video_id = payload["video_id"]
+    video_chunk_dir = CHUNKS_DIR / video_id
+    try:
+        outputs = fragment_and_extract(
+            payload["upload_path"],
+            str(video_chunk_dir),
+            chunk_seconds=10,
+            audio_path=str(video_chunk_dir / "audio.wav") if WhisperModel is not None else None,
+            exact_boundaries=True,
+            smart_cut=True,
+        )
+        manifest_path = video_chunk_dir / "manifest.json"
+        service.index_chunks(
+            video_id,
+            outputs.manifest,
+            audio_path=outputs.audio_path,
+            has_audio=outputs.has_audio,
+        )
+        if outputs.audio_path is not None:
+            outputs.audio_path.unlink(missing_ok=True)
+        service.set_status(video_id, "ready", manifest_path=manifest_path)
+    except Exception:
+        service.set_status(video_id, "failed")
+        raise
+    return len(outputs.manifest)
+
+
 service = SearchService(DB_PATH)
 service.setup()
 
+# Uploads are fragmented and indexed off the event loop; /status reports progress.
+job_runner = BackgroundJobRunner(process_upload, workers=UPLOAD_WORKERS)
+job_runner.start()
+
 app = FastAPI(title="Entropy Memory Search")
 app.add_middleware(
     CORSMiddleware,
@@ -239,7 +458,7 @@ def home() -> FileResponse:
     return FileResponse(STATIC_DIR / "index.html")
 
 
-@app.post("/upload")
+@app.post("/upload", status_code=202)
 async def upload_video(file: UploadFile = File(...)) -> Dict[str, Any]:
     if not file.filename:
         raise HTTPException(status_code=400, detail="filename required")
@@ -247,20 +466,18 @@ async def upload_video(file: UploadFile = File(...)) -> Dict[str, Any]:
     safe_name = f"{uuid.uuid4()}_{Path(file.filename).name}"
     upload_path = UPLOAD_DIR / safe_name
     with upload_path.open("wb") as handle:
-        handle.write(await file.read())
+        while chunk := await file.read(UPLOAD_READ_SIZE):
+            handle.write(chunk)
 
     video_id = service.create_video(file.filename, upload_path)
-    video_chunk_dir = CHUNKS_DIR / video_id
-    try:
-        manifest = chunk_video(str(upload_path), str(video_chunk_dir), chunk_seconds=10, exact_boundaries=True)
-        manifest_path = video_chunk_dir / "manifest.json"
-        service.index_chunks(video_id, manifest)
-        service.set_status(video_id, "ready", manifest_path=manifest_path)
-    except Exception as exc:  # noqa: BLE001
-        service.set_status(video_id, "failed")
-        raise HTTPException(status_code=500, detail=f"processing failed: {exc}") from exc
-
-    return {"video_id": video_id, "status": "ready", "chunks": len(manifest)}
+    job_runner.submit(
+        Job(
+            job_id=video_id,
+            payload={"video_id": video_id, "upload_path": str(upload_path)},
+            max_retries=0,
+        )
+    )
+    return {"video_id": video_id, "status": "processing"}
 
 
 @app.get("/videos")
@@ -270,7 +487,11 @@ def videos() -> Dict[str, Any]:
 
 @app.get("/status/{video_id}")
 def status(video_id: str) -> Dict[str, Any]:
-    return service.get_video_status(video_id)
+    result = service.get_video_status(video_id)
+    failure = job_runner.failed.get(video_id)
+    if failure is not None:
+        result["error"] = failure.error
+    return result
 
 
 @app.get("/search")
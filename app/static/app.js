@@ -40,7 +40,13 @@ fileInput.addEventListener('change', () => {
       return;
     }
 
-    uploadStatus.textContent = `Ready ✓ Video ID: ${data.video_id} • ${data.chunks} chunks indexed`;
+    uploadStatus.textContent = `Indexing chunks... Video ID: ${data.video_id}`;
+    const result = await waitForIndexing(data.video_id);
+    if (result.video.status === 'ready') {
+      uploadStatus.textContent = `Ready ✓ Video ID: ${data.video_id} • ${result.chunks.length} chunks indexed`;
+    } else {
+      uploadStatus.textContent = `Error: ${result.error || 'processing failed'}`;
+    }
   } catch (error) {
     uploadStatus.textContent = `Error: ${error.message}`;
   } finally {
@@ -48,6 +54,22 @@ fileInput.addEventListener('change', () => {
   }
 });
 
+const INDEX_POLL_MS = 1000;
+const INDEX_POLL_LIMIT = 1800;
+
+async function waitForIndexing(videoId) {
+  for (let attempt = 0; attempt < INDEX_POLL_LIMIT; attempt++) {
+    await new Promise((resolve) => setTimeout(resolve, INDEX_POLL_MS));
+    const res = await fetch(`/status/${videoId}`);
+    const data = await res.json();
+    if (!res.ok) {
+      throw new Error(data.detail || 'Status check failed');
+    }
+    if (data.video.status !== 'processing') return data;
+  }
+  throw new Error('Timed out waiting for indexing');
+}
+
 searchBtn.addEventListener('click', runSearch);
 queryInput.addEventListener('keydown', (event) => {
   if (event.key === 'Enter') runSearch();
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from app.fragmentation import KEYFRAME_EPSILON_S, _plan_smart_cut
+
+# GOP of 77 frames at 30 fps: keyframes never land on a 10 s chunk boundary.
+GOP77 = [round(i * 77 / 30, 6) for i in range(10)]
+
+
+def test_no_keyframes_reencodes_whole_chunk():
+    assert _plan_smart_cut([], 0.0, 10.0) == [(0.0, 10.0, False)]
+
+
+def test_keyframes_on_both_boundaries_copy_everything():
+    assert _plan_smart_cut([0.0, 5.0, 10.0], 0.0, 10.0) == [(0.0, 10.0, True)]
+
+
+def test_partial_gops_are_reencoded_at_both_ends():
+    assert _plan_smart_cut(GOP77, 10.0, 20.0) == [
+        (10.0, 10.266667, False),
+        (10.266667, 17.966667, True),
+        (17.966667, 20.0, False),
+    ]
+
+
+def test_first_chunk_starting_on_a_keyframe_has_no_head_piece():
+    assert _plan_smart_cut(GOP77, 0.0, 10.0) == [(0.0, 7.7, True), (7.7, 10.0, False)]
+
+
+def test_keyframe_only_after_the_chunk_reencodes_whole_chunk():
+    assert _plan_smart_cut([0.0, 12.0], 2.0, 10.0) == [(2.0, 10.0, False)]
+
+
+def test_keyframe_within_epsilon_of_end_is_not_copied():
+    end_s = 10.0
+    assert _plan_smart_cut([0.0, end_s - KEYFRAME_EPSILON_S / 2], 1.0, end_s) == [(1.0, end_s, False)]
+
+
+def test_single_keyframe_inside_chunk_splits_into_two_reencodes():
+    assert _plan_smart_cut([0.0, 15.0, 30.0], 10.0, 20.0) == [(10.0, 15.0, False), (15.0, 20.0, False)]
+
+
+def test_keyframe_just_inside_start_absorbs_the_head_piece():
+    start_s = 10.0
+    k_in = start_s + KEYFRAME_EPSILON_S / 2
+    assert _plan_smart_cut([0.0, k_in, 15.0, 30.0], start_s, 20.0) == [(k_in, 15.0, True), (15.0, 20.0, False)]
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_pieces_tile_the_chunk_and_copies_start_on_keyframes(seed):
+    rng = random.Random(seed)
+    keyframes = sorted({round(rng.uniform(0, 60), 3) for _ in range(rng.randint(0, 12))} | {0.0})
+    start_s = rng.choice([0.0, 10.0, 20.0, 30.0])
+    end_s = start_s + 10.0
+
+    parts = _plan_smart_cut(keyframes, start_s, end_s)
+
+    assert parts
+    assert parts[0][0] == pytest.approx(start_s, abs=KEYFRAME_EPSILON_S)
+    assert parts[-1][1] == pytest.approx(end_s, abs=KEYFRAME_EPSILON_S)
+    for (_, prev_end, _), (next_start, _, _) in zip(parts, parts[1:]):
+        assert prev_end == next_start
+    assert sum(copy for _, _, copy in parts) <= 1
+    for part_start, part_end, copy in parts:
+        assert part_end > part_start
+        if copy:
+            assert part_start in keyframes